@@ -1,10 +1,34 @@
 import asyncio
+import csv
+import datetime
+import hashlib
+import io
+import string
+import sys
+import time
+from dataclasses import dataclass
+import httpx
+import ijson
+import orjson
 import streamlit as st
-from typing import Dict, Any, List
-from agents import Agent, Runner, trace
-from agents import set_default_openai_key
-from firecrawl import FirecrawlApp
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from typing import Dict, Any, List, Set, Tuple, Union
+from agents import Agent, Runner, RunConfig, RunContextWrapper, ToolCallOutputItem
+from agents import OpenAIProvider
+from agents.result import RunResultBase
 from agents.tool import function_tool
+from openai.types.responses import ResponseTextDeltaEvent
+
+FIRECRAWL_DEEP_RESEARCH_URL = "https://api.firecrawl.dev/v1/deep-research"
+# Extra seconds past a job's time limit to wait before giving up on it
+POLL_DEADLINE_MARGIN = 120
+
+# Run this app's event loops on libuv where available, without touching the global loop policy
+if sys.platform != "win32":
+    import uvloop
+    EVENT_LOOP_FACTORY = uvloop.new_event_loop
+else:
+    EVENT_LOOP_FACTORY = None
 
 # Set page configuration
 st.set_page_config(
@@ -35,7 +59,6 @@ with st.sidebar:
     
     if openai_api_key:
         st.session_state.openai_api_key = openai_api_key
-        set_default_openai_key(openai_api_key)
     if firecrawl_api_key:
         st.session_state.firecrawl_api_key = firecrawl_api_key
 
@@ -43,143 +66,468 @@ with st.sidebar:
 st.title("📘 OpenAI Deep Research Agent")
 st.markdown("This OpenAI Agent from the OpenAI Agents SDK performs deep research on any topic using Firecrawl")
 
-# Research topic input
-research_topic = st.text_input("Enter your research topic:", placeholder="e.g., Latest developments in AI")
+# Research topic input, one topic per line
+research_input = st.text_area(
+    "Enter your research topic (one per line to research several at once):",
+    placeholder="e.g., Latest developments in AI"
+)
+topics_file = st.file_uploader(
+    "Or upload a file of topics (.txt with one per line, or .csv with topics in the first column)",
+    type=["txt", "csv"]
+)
+
+research_lines = research_input.splitlines()
+if topics_file is not None:
+    try:
+        # utf-8-sig drops the byte order mark that spreadsheet exports often add
+        file_text = topics_file.getvalue().decode("utf-8-sig")
+    except UnicodeDecodeError:
+        st.error("Could not read the topics file. Please upload a UTF-8 encoded .txt or .csv file.")
+    else:
+        if topics_file.name.endswith(".csv"):
+            research_lines += [row[0] for row in csv.reader(io.StringIO(file_text)) if row]
+        else:
+            research_lines += file_text.splitlines()
+research_topics = list(dict.fromkeys(line.strip() for line in research_lines if line.strip()))
+
+always_elaborate = st.checkbox(
+    "Always elaborate",
+    help="Run the elaboration pass even when the initial report is already comprehensive"
+)
+
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """Create a pooled HTTP client that survives Streamlit reruns and is shared across threads."""
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(180.0),
+        http2=True
+    )
+
+def stream_json_fields(url: str, fields: Set[str], **kwargs) -> Dict[str, Any]:
+    """Stream a JSON response and build only the given dotted fields as bytes arrive.
+
+    Everything else (e.g. the long activity log of a deep research job) is
+    parsed and dropped without ever holding the full body in memory.
+    """
+    results = {}
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events, use_float=True)
+    builder, field, depth = None, None, 0
+    
+    with get_http_client().stream("GET", url, **kwargs) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_bytes():
+            parser.send(chunk)
+            for prefix, event, value in events:
+                if builder is None and prefix in fields:
+                    builder, field, depth = ijson.ObjectBuilder(), prefix, 0
+                if builder is None:
+                    continue
+                builder.event(event, value)
+                if event in ("start_map", "start_array"):
+                    depth += 1
+                elif event in ("end_map", "end_array"):
+                    depth -= 1
+                if depth == 0:
+                    results[field] = builder.value
+                    builder = None
+            del events[:]
+    parser.close()
+    return results
+
+def is_retryable_status(error: BaseException) -> bool:
+    """Rate limits and server errors are worth retrying."""
+    return isinstance(error, httpx.HTTPStatusError) and (
+        error.response.status_code == 429 or error.response.status_code >= 500
+    )
+
+def is_transient_error(error: BaseException) -> bool:
+    """Any network failure can be retried for idempotent requests."""
+    return is_retryable_status(error) or isinstance(error, httpx.TransportError)
+
+def is_unsent_error(error: BaseException) -> bool:
+    """Only retry a job start if the request never reached Firecrawl, so a job is not created twice."""
+    return is_retryable_status(error) or isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout))
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(multiplier=2, max=30),
+    retry=retry_if_exception(is_unsent_error),
+    reraise=True
+)
+def start_deep_research_job(payload: Dict[str, Any], headers: Dict[str, str]) -> str:
+    """Start a Firecrawl deep research job and return its id."""
+    resp = get_http_client().post(FIRECRAWL_DEEP_RESEARCH_URL, headers=headers, content=orjson.dumps(payload))
+    resp.raise_for_status()
+    return orjson.loads(resp.content)["id"]
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(multiplier=2, max=30),
+    retry=retry_if_exception(is_transient_error),
+    reraise=True
+)
+def poll_deep_research_job(job_id: str, headers: Dict[str, str]) -> Dict[str, Any]:
+    """Fetch the status of a deep research job, keeping only the fields the tool uses."""
+    return stream_json_fields(
+        f"{FIRECRAWL_DEEP_RESEARCH_URL}/{job_id}",
+        {"status", "error", "data.finalAnalysis", "data.sources"},
+        headers=headers
+    )
+
+def research_week() -> str:
+    """Return the current ISO year and week, e.g. "2026-W42", used to expire cached research."""
+    year, week, _ = datetime.date.today().isocalendar()
+    return f"{year}-W{week:02d}"
+
+@st.cache_data(persist="disk", max_entries=100, show_spinner=False)
+def firecrawl_deep_research(
+    query: str,
+    max_depth: int,
+    time_limit: int,
+    max_urls: int,
+    api_key: str,
+    research_week: str
+) -> Dict[str, Any]:
+    """Run a Firecrawl deep research job and return its data, cached per parameter set.
+
+    Streamlit ignores ttl on disk caches, so the ISO week is part of the key to
+    make results expire weekly. max_entries only bounds the in-memory layer;
+    pickles from past weeks stay on disk until `streamlit cache clear`.
+    """
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {
+        "query": query,
+        "maxDepth": max_depth,
+        "timeLimit": time_limit,
+        "maxUrls": max_urls
+    }
+    
+    job_id = start_deep_research_job(payload, headers)
+    
+    # Firecrawl runs deep research as a background job, so poll until it finishes
+    deadline = time.monotonic() + time_limit + POLL_DEADLINE_MARGIN
+    while time.monotonic() < deadline:
+        time.sleep(2)
+        results = poll_deep_research_job(job_id, headers)
+        
+        status = results.get("status")
+        if status == "completed":
+            return {
+                "finalAnalysis": results.get("data.finalAnalysis", ""),
+                "sources": results.get("data.sources", [])
+            }
+        if status != "processing":
+            raise RuntimeError(results.get("error") or f"Deep research job ended with status {status!r}")
+    
+    raise TimeoutError(f"Deep research job {job_id} did not finish within {time_limit + POLL_DEADLINE_MARGIN} seconds")
+
+@dataclass
+class ResearchContext:
+    """Per-run state the Agents SDK hands to the research tools."""
+    firecrawl_api_key: str
 
-# Keep the original deep_research tool
 @function_tool
-async def deep_research(query: str, max_depth: int, time_limit: int, max_urls: int) -> Dict[str, Any]:
+async def deep_research(ctx: RunContextWrapper[ResearchContext], query: str, max_depth: int, time_limit: int, max_urls: int) -> Dict[str, Any]:
     """
     Perform comprehensive web research using Firecrawl's deep research endpoint.
     """
     try:
-        # Initialize FirecrawlApp with the API key from session state
-        firecrawl_app = FirecrawlApp(api_key=st.session_state.firecrawl_api_key)
-        
-        # Define research parameters
-        params = {
-            "maxDepth": max_depth,
-            "timeLimit": time_limit,
-            "maxUrls": max_urls
-        }
-        
-        # Set up a callback for real-time updates
-        def on_activity(activity):
-            st.write(f"[{activity['type']}] {activity['message']}")
-        
-        # Run deep research
-        with st.spinner("Performing deep research..."):
-            results = firecrawl_app.deep_research(
-                query=query,
-                params=params,
-                on_activity=on_activity
-            )
+        # Run deep research off the event loop; repeated queries are served from the cache
+        data = await asyncio.to_thread(
+            firecrawl_deep_research,
+            query,
+            max_depth,
+            time_limit,
+            max_urls,
+            ctx.context.firecrawl_api_key,
+            research_week()
+        )
         
         return {
             "success": True,
-            "final_analysis": results['data']['finalAnalysis'],
-            "sources_count": len(results['data']['sources']),
-            "sources": results['data']['sources']
+            "final_analysis": data['finalAnalysis'],
+            "sources_count": len(data['sources']),
+            "sources": data['sources']
         }
     except Exception as e:
-        st.error(f"Deep research error: {str(e)}")
-        return {"error": str(e), "success": False}
-
-# Keep the original agents
-research_agent = Agent(
-    name="research_agent",
-    instructions="""You are a research assistant that can perform deep web research on any topic.
-
-    When given a research topic or question:
-    1. Use the deep_research tool to gather comprehensive information
-       - Always use these parameters:
-         * max_depth: 3 (for moderate depth)
-         * time_limit: 180 (3 minutes)
-         * max_urls: 10 (sufficient sources)
-    2. The tool will search the web, analyze multiple sources, and provide a synthesis
-    3. Review the research results and organize them into a well-structured report
-    4. Include proper citations for all sources
-    5. Highlight key findings and insights
-    """,
-    tools=[deep_research]
-)
+        # Errors are surfaced by the caller, tools should not touch Streamlit
+        http_status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+        return {"success": False, "error": str(e), "http_status": http_status}
 
-elaboration_agent = Agent(
-    name="elaboration_agent",
-    instructions="""You are an expert content enhancer specializing in research elaboration.
-
-    When given a research report:
-    1. Analyze the structure and content of the report
-    2. Enhance the report by:
-       - Adding more detailed explanations of complex concepts
-       - Including relevant examples, case studies, and real-world applications
-       - Expanding on key points with additional context and nuance
-       - Adding visual elements descriptions (charts, diagrams, infographics)
-       - Incorporating latest trends and future predictions
-       - Suggesting practical implications for different stakeholders
-    3. Maintain academic rigor and factual accuracy
-    4. Preserve the original structure while making it more comprehensive
-    5. Ensure all additions are relevant and valuable to the topic
-    """
-)
+@st.cache_resource
+def get_agents() -> Tuple[Agent, Agent]:
+    """Build the research and elaboration agents once instead of on every rerun."""
+    research_agent = Agent(
+        name="research_agent",
+        instructions="""You are a research assistant that can perform deep web research on any topic.
+
+        When given a research topic or question:
+        1. Use the deep_research tool to gather comprehensive information
+           - Always use these parameters:
+             * max_depth: 3 (for moderate depth)
+             * time_limit: 180 (3 minutes)
+             * max_urls: 10 (sufficient sources)
+        2. The tool will search the web, analyze multiple sources, and provide a synthesis
+        3. Review the research results and organize them into a well-structured report
+        4. Include proper citations for all sources
+        5. Highlight key findings and insights
+        """,
+        tools=[deep_research]
+    )
 
-async def run_research_process(topic: str):
-    """Run the complete research process."""
-    # Step 1: Initial Research
-    with st.spinner("Conducting initial research..."):
-        research_result = await Runner.run(research_agent, topic)
-        initial_report = research_result.final_output
+    elaboration_agent = Agent(
+        name="elaboration_agent",
+        instructions="""You are an expert content enhancer specializing in research elaboration.
+
+        When given a research report:
+        1. Analyze the structure and content of the report
+        2. Enhance the report by:
+           - Adding more detailed explanations of complex concepts
+           - Including relevant examples, case studies, and real-world applications
+           - Expanding on key points with additional context and nuance
+           - Adding visual elements descriptions (charts, diagrams, infographics)
+           - Incorporating latest trends and future predictions
+           - Suggesting practical implications for different stakeholders
+        3. Maintain academic rigor and factual accuracy
+        4. Preserve the original structure while making it more comprehensive
+        5. Ensure all additions are relevant and valuable to the topic
+        """
+    )
+    return research_agent, elaboration_agent
+
+research_agent, elaboration_agent = get_agents()
+
+# Initial reports at least this long and this sectioned skip the elaboration pass
+COMPREHENSIVE_REPORT_CHARS = 6000
+COMPREHENSIVE_REPORT_SECTIONS = 4
+
+def is_comprehensive(report: str) -> bool:
+    """Cheaply check whether a report is already detailed enough to skip elaboration."""
+    return len(report) > COMPREHENSIVE_REPORT_CHARS and report.count("\n## ") >= COMPREHENSIVE_REPORT_SECTIONS
+
+def openai_run_config(openai_api_key: str) -> RunConfig:
+    """Bind a run, and its trace export, to the user's own OpenAI key instead of the SDK's process-wide default."""
+    return RunConfig(
+        model_provider=OpenAIProvider(api_key=openai_api_key),
+        tracing={"api_key": openai_api_key}
+    )
+
+async def run_agent(agent: Agent, agent_input: str, placeholder=None, **kwargs) -> RunResultBase:
+    """Run an agent, streaming its text into a Streamlit placeholder when one is given."""
+    if placeholder is None:
+        return await Runner.run(agent, agent_input, **kwargs)
+    
+    result = Runner.run_streamed(agent, agent_input, **kwargs)
+    streamed_text = ""
+    async for event in result.stream_events():
+        if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+            streamed_text += event.data.delta
+            placeholder.markdown(streamed_text)
+    return result
+
+def tool_errors(result: RunResultBase) -> List[str]:
+    """Collect the error messages of failed tool calls in an agent run."""
+    return [
+        item.output["error"]
+        for item in result.new_items
+        if isinstance(item, ToolCallOutputItem)
+        and isinstance(item.output, dict)
+        and item.output.get("success") is False
+    ]
+
+async def conduct_research(topic: str, firecrawl_api_key: str, run_config: RunConfig, placeholder=None) -> str:
+    """Run the research agent and return the initial report."""
+    research_result = await run_agent(
+        research_agent,
+        topic,
+        placeholder,
+        context=ResearchContext(firecrawl_api_key),
+        run_config=run_config
+    )
+    for error in tool_errors(research_result):
+        st.error(f"Deep research error for {topic!r}: {error}")
+    return research_result.final_output
+
+ELABORATION_TEMPLATE = string.Template("""
+    RESEARCH TOPIC: $topic
     
-    # Display initial report in an expander
-    with st.expander("View Initial Research Report"):
-        st.markdown(initial_report)
+    INITIAL RESEARCH REPORT:
+    $report
     
-    # Step 2: Enhance the report
-    with st.spinner("Enhancing the report with additional information..."):
-        elaboration_input = f"""
-        RESEARCH TOPIC: {topic}
-        
-        INITIAL RESEARCH REPORT:
-        {initial_report}
+    Please enhance this research report with additional information, examples, case studies, 
+    and deeper insights while maintaining its academic rigor and factual accuracy.
+    """)
+
+def report_key(topic: str, initial_report: str) -> Tuple[str, str]:
+    """Key an initial report by its topic and a short hash of its text."""
+    return topic, hashlib.blake2b(initial_report.encode(), digest_size=8).hexdigest()
+
+async def elaborate_report(topic: str, initial_report: str, run_config: RunConfig, placeholder=None) -> str:
+    """Run the elaboration agent over an initial report.
+
+    Enhanced reports are memoized in st.session_state.elaboration_memo under
+    report_key(), so reruns render them from there instead of re-billing the LLM.
+    """
+    memo = st.session_state.setdefault("elaboration_memo", {})
+    key = report_key(topic, initial_report)
+    if key in memo:
+        if placeholder is not None:
+            placeholder.markdown(memo[key])
+        return memo[key]
+    
+    elaboration_input = ELABORATION_TEMPLATE.substitute(topic=topic, report=initial_report)
+    elaboration_result = await run_agent(elaboration_agent, elaboration_input, placeholder, run_config=run_config)
+    memo[key] = elaboration_result.final_output
+    return elaboration_result.final_output
+
+async def run_research_process(
+    topic: str,
+    firecrawl_api_key: str,
+    run_config: RunConfig,
+    always_elaborate: bool = False
+) -> Tuple[str, str, bool]:
+    """Run the complete research process.
+
+    Returns the initial report, the final report and whether the elaboration pass ran.
+    """
+    with st.status("Researching...", expanded=True) as status:
+        # Step 1: Initial Research
+        # Both stages stream their output into the status container as it is generated
+        status.update(label="Conducting initial research...")
+        initial_report = await conduct_research(topic, firecrawl_api_key, run_config, st.empty())
         
-        Please enhance this research report with additional information, examples, case studies, 
-        and deeper insights while maintaining its academic rigor and factual accuracy.
-        """
+        # Step 2: Enhance the report unless it is already comprehensive
+        if not always_elaborate and is_comprehensive(initial_report):
+            status.update(
+                label="Research complete (elaboration skipped, the initial report is already comprehensive)",
+                state="complete",
+                expanded=False
+            )
+            return initial_report, initial_report, False
         
-        elaboration_result = await Runner.run(elaboration_agent, elaboration_input)
-        enhanced_report = elaboration_result.final_output
+        status.update(label="Enhancing the report with additional information...")
+        enhanced_report = await elaborate_report(topic, initial_report, run_config, st.empty())
+        status.update(label="Research complete", state="complete", expanded=False)
+    
+    return initial_report, enhanced_report, True
+
+async def run_batch_async(
+    topics: List[str],
+    firecrawl_api_key: str,
+    run_config: RunConfig,
+    max_concurrency: int = 8,
+    always_elaborate: bool = False
+) -> List[Union[Tuple[str, str], BaseException]]:
+    """Research several topics concurrently, overlapping their API waits.
+
+    Returns an (initial report, final report) pair per topic.
+    A semaphore caps how many topics hit OpenAI and Firecrawl at once to avoid 429s.
+    A failed topic comes back as its exception so the other reports are kept.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def research_one(topic: str) -> Tuple[str, str]:
+        async with semaphore:
+            initial_report = await conduct_research(topic, firecrawl_api_key, run_config)
+            if not always_elaborate and is_comprehensive(initial_report):
+                return initial_report, initial_report
+            return initial_report, await elaborate_report(topic, initial_report, run_config)
     
-    return enhanced_report
+    return await asyncio.gather(*(research_one(topic) for topic in topics), return_exceptions=True)
+
+def run_async(coro):
+    """Run a coroutine to completion on a fresh event loop from EVENT_LOOP_FACTORY."""
+    with asyncio.Runner(loop_factory=EVENT_LOOP_FACTORY) as runner:
+        return runner.run(coro)
 
 # Main research process
-if st.button("Start Research", disabled=not (openai_api_key and firecrawl_api_key and research_topic)):
+if st.button("Start Research", disabled=not (openai_api_key and firecrawl_api_key and research_topics)):
     if not openai_api_key or not firecrawl_api_key:
         st.warning("Please enter both API keys in the sidebar.")
-    elif not research_topic:
+    elif not research_topics:
         st.warning("Please enter a research topic.")
-    else:
+    elif len(research_topics) == 1:
+        research_topic = research_topics[0]
+        st.session_state.research_results = []
         try:
-            # Create placeholder for the final report
-            report_placeholder = st.empty()
-            
             # Run the research process
-            enhanced_report = asyncio.run(run_research_process(research_topic))
+            initial_report, _, _ = run_async(
+                run_research_process(research_topic, firecrawl_api_key, openai_run_config(openai_api_key), always_elaborate)
+            )
+            st.session_state.research_results = [
+                {"topic": research_topic, "initial_report": initial_report, "error": None}
+            ]
             
-            # Display the enhanced report
-            report_placeholder.markdown("## Enhanced Research Report")
-            report_placeholder.markdown(enhanced_report)
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+    else:
+        st.session_state.research_results = []
+        try:
+            with st.status(f"Researching {len(research_topics)} topics...", expanded=True) as status:
+                batch_reports = run_async(run_batch_async(
+                    research_topics,
+                    firecrawl_api_key,
+                    openai_run_config(openai_api_key),
+                    always_elaborate=always_elaborate
+                ))
+                status.update(label="Research complete", state="complete", expanded=False)
             
-            # Add download button
-            st.download_button(
-                "Download Report",
-                enhanced_report,
-                file_name=f"{research_topic.replace(' ', '_')}_report.md",
-                mime="text/markdown"
-            )
+            st.session_state.research_results = [
+                {"topic": research_topic, "initial_report": None, "error": str(reports)}
+                if isinstance(reports, BaseException)
+                else {"topic": research_topic, "initial_report": reports[0], "error": None}
+                for research_topic, reports in zip(research_topics, batch_reports)
+            ]
             
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
 
+# Display the latest results from session state, so reruns such as download clicks keep them
+research_results = st.session_state.get("research_results", [])
+elaboration_memo = st.session_state.get("elaboration_memo", {})
+
+# Only keep enhanced reports the current results still refer to
+current_keys = {
+    report_key(result["topic"], result["initial_report"])
+    for result in research_results
+    if result["initial_report"] is not None
+}
+st.session_state.elaboration_memo = elaboration_memo = {
+    key: report for key, report in elaboration_memo.items() if key in current_keys
+}
+
+is_batch = len(research_results) > 1
+for result in research_results:
+    research_topic = result["topic"]
+    if result["error"]:
+        st.markdown(f"## {research_topic}")
+        st.error(f"An error occurred: {result['error']}")
+        continue
+    
+    # Reports that skipped elaboration have no memo entry and show the initial report
+    enhanced_report = elaboration_memo.get(report_key(research_topic, result["initial_report"]))
+    final_report = enhanced_report or result["initial_report"]
+    if is_batch:
+        st.markdown(f"## {research_topic}")
+        st.markdown(final_report)
+    else:
+        report_heading = "Enhanced Research Report" if enhanced_report else "Research Report"
+        st.markdown(f"## {report_heading}\n\n{final_report}")
+        if enhanced_report:
+            with st.expander("View Initial Research Report"):
+                st.markdown(result["initial_report"])
+    
+    # Add download button
+    st.download_button(
+        "Download Report",
+        final_report,
+        file_name=f"{research_topic.replace(' ', '_')}_report.md",
+        mime="text/markdown",
+        key=f"download_{research_topic}"
+    )
+
 # Footer
 st.markdown("---")
 st.markdown("Powered by OpenAI Agents SDK and Firecrawl") 